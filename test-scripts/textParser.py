@@ -1,14 +1,62 @@
-import pdfplumber
-import json
+import fitz  # PyMuPDF
+import io
+import orjson
+from joblib import Parallel, delayed
 
-output = {}
+def parse_page(path, i):
+    # Each worker opens its own document; PyMuPDF pages can't be pickled
+    with fitz.open(path) as doc:
+        # doctop is measured from the top of the first page, as in pdfplumber
+        page_offset = sum(doc[n].rect.height for n in range(i))
+        page = doc[i]
+        # Clip to the page so the words and dict extractions see the same blocks and lines
+        textpage = page.get_textpage(flags=fitz.TEXTFLAGS_WORDS)
+        block_lines = {
+            b["number"]: b["lines"]
+            for b in page.get_text("dict", textpage=textpage)["blocks"] if b["type"] == 0
+        }
 
-with pdfplumber.open("f1040.pdf") as pdf:
-    for i, page in enumerate(pdf.pages):
-        # Extract words, including font size
-        words = page.extract_words(extra_attrs=['size'])
-        output[f"page_{i + 1}"] = words
+        words = []
+        for x0, y0, x1, y1, text, block_no, line_no, _ in page.get_text("words", textpage=textpage):
+            lines = block_lines.get(block_no, [])
+            line = lines[line_no] if line_no < len(lines) else None
 
-# Save to JSON file
-with open("f1040_words.json", "w", encoding="utf-8") as f:
-    json.dump(output, f, indent=2)
\ No newline at end of file
+            # Font size comes from the span the word sits in
+            spans = line["spans"] if line else []
+            mid_x = (x0 + x1) / 2
+            span = next((s for s in spans if s["bbox"][0] <= mid_x <= s["bbox"][2]),
+                        spans[0] if spans else None)
+
+            # Left-to-right horizontal text is upright
+            upright = line is None or (line["dir"][0] > 0 and abs(line["dir"][1]) < 1e-3)
+
+            words.append({
+                "text": text,
+                "x0": x0,
+                "x1": x1,
+                "top": y0,
+                "doctop": page_offset + y0,
+                "bottom": y1,
+                "upright": upright,
+                "height": y1 - y0,
+                "width": x1 - x0,
+                "size": span["size"] if span else None
+            })
+        return i, words
+
+if __name__ == "__main__":
+    with fitz.open("f1040.pdf") as doc:
+        n_pages = len(doc)
+
+    # Results are yielded in page order, so each page can be written as it arrives
+    results = Parallel(n_jobs=-1, return_as="generator")(delayed(parse_page)("f1040.pdf", i) for i in range(n_pages))
+
+    # Stream pages into the JSON object instead of serializing it all at once
+    with io.BufferedWriter(io.FileIO("f1040_words.json", "w"), buffer_size=1 << 20) as f:
+        f.write(b"{")
+        for i, words in results:
+            if i:
+                f.write(b",")
+            f.write(f'"page_{i + 1}":'.encode())
+            f.write(orjson.dumps(words))
+        f.write(b"}")
@@ -1,194 +1,285 @@
 import cv2
 import numpy as np
-from pdf2image import convert_from_path
-try:
-    import fitz  # PyMuPDF
-    PYMUPDF_AVAILABLE = True
-except ImportError:
-    print("PyMuPDF not available, skipping PDF vector extraction")
-    PYMUPDF_AVAILABLE = False
-from PIL import Image
-import json
+import fitz  # PyMuPDF
+import io
+import multiprocessing as mp
+import os
+import orjson
 
-def detect_lines_and_colors(pdf_path, page_num=0, dpi=150):
+# FastLineDetector ships with opencv-contrib-python; fall back to HoughLinesP without it
+FLD_AVAILABLE = hasattr(cv2, "ximgproc")
+
+# Run page-wide OpenCV passes through OpenCL (T-API) when a device is available
+USE_OPENCL = cv2.ocl.haveOpenCL()
+cv2.ocl.setUseOpenCL(USE_OPENCL)
+
+# Pixel thresholds below were tuned at REFERENCE_DPI; pages are rendered at
+# DETECTION_DPI by default and thresholds are scaled to match
+REFERENCE_DPI = 150
+DETECTION_DPI = 100
+
+def scale_px(pixels, dpi, minimum=1):
+    """
+    Scale a pixel threshold tuned at REFERENCE_DPI to the given DPI
+    """
+    return max(minimum, round(pixels * dpi / REFERENCE_DPI))
+
+def to_numpy(mat):
+    """
+    Download a UMat result to a NumPy array, passing arrays through
+    """
+    return mat.get() if isinstance(mat, cv2.UMat) else mat
+
+def render_page(page, dpi=DETECTION_DPI):
+    """
+    Render a PyMuPDF page to a BGR image
+    """
+    zoom = dpi / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    return cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+
+def detect_page_range(pdf_path, first_page, last_page, dpi=DETECTION_DPI):
+    """
+    Detect elements on pages first_page..last_page (0-based, inclusive)
+    """
+    with fitz.open(pdf_path) as doc:
+        return {
+            page_num: detect_lines_and_colors(pdf_path, page_num, dpi, doc=doc)
+            for page_num in range(first_page, last_page + 1)
+        }
+
+# Document opened once per pool worker by _init_page_worker
+_worker_doc = None
+
+def _init_page_worker(pdf_path):
+    global _worker_doc
+    _worker_doc = fitz.open(pdf_path)
+
+def _detect_page_worker(args):
+    pdf_path, page_num, dpi = args
+    return page_num, detect_lines_and_colors(pdf_path, page_num, dpi, doc=_worker_doc)
+
+def detect_all_pages(pdf_path, dpi=DETECTION_DPI):
+    """
+    Detect elements on every page, spreading pages over worker processes
+    """
+    with fitz.open(pdf_path) as doc:
+        n_pages = len(doc)
+    
+    # Each worker opens the PDF once, so only paths and results cross processes
+    tasks = [(pdf_path, page_num, dpi) for page_num in range(n_pages)]
+    # OpenCL state set up at import doesn't survive fork, so only then pay for spawn
+    context = mp.get_context("spawn") if USE_OPENCL else mp.get_context()
+    processes = max(1, min(os.cpu_count() or 1, 4, n_pages))
+    with context.Pool(processes, initializer=_init_page_worker, initargs=(pdf_path,)) as pool:
+        pages = dict(pool.imap_unordered(_detect_page_worker, tasks))
+    return {page_num: pages[page_num] for page_num in range(n_pages)}
+
+def detect_lines_and_colors(pdf_path, page_num=0, dpi=DETECTION_DPI, doc=None):
     """
     Detect lines and background colors from PDF
+    
+    Pass an open fitz.Document as doc to reuse it across pages; the caller
+    then owns closing it.
     """
+    if doc is None:
+        with fitz.open(pdf_path) as doc:
+            return detect_lines_and_colors(pdf_path, page_num, dpi, doc=doc)
+    
     results = {
         "lines": [],
         "background_colors": [],
         "checkboxes": []
     }
     
-    # Method 1: Using pdf2image + OpenCV for line detection
-    pages = convert_from_path(pdf_path, dpi=dpi, first_page=page_num+1, last_page=page_num+1)
-    if not pages:
+    if page_num >= len(doc):
         return results
+    page = doc[page_num]
     
-    # Convert PIL image to OpenCV format
-    img = cv2.cvtColor(np.array(pages[0]), cv2.COLOR_RGB2BGR)
+    # Method 1: Using PyMuPDF rendering + OpenCV for line detection
+    img = render_page(page, dpi)
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     
+    # Sample background colors, then drop the full-color page before any
+    # clustering so it isn't held alongside KMeans' working buffers
+    colors, positions = sample_background_colors(img, dpi)
+    del img
+    
+    # Shared preprocessing, computed once per page (on the GPU when OpenCL is usable)
+    # FLD finds its own edges, so Canny is only needed for the HoughLinesP fallback
+    gray_src = cv2.UMat(gray) if USE_OPENCL else gray
+    edges = None if FLD_AVAILABLE else cv2.Canny(gray_src, 100, 200, apertureSize=3)
+    cleaned = to_numpy(cv2.morphologyEx(gray_src, cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8)))
+    binary = to_numpy(cv2.adaptiveThreshold(gray_src, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                            cv2.THRESH_BINARY_INV, scale_px(15, dpi, minimum=3) | 1, 5))
+    
     # Detect lines
-    results["lines"] = detect_lines(gray, dpi)
+    results["lines"] = detect_lines(gray, edges, dpi)
     
     # Detect background colors
-    results["background_colors"] = detect_background_colors(img, dpi)
+    results["background_colors"] = cluster_background_colors(colors, positions, dpi)
     
     # Detect checkboxes
-    results["checkboxes"] = detect_checkboxes(gray, dpi)
-    
-    # Method 2: Using PyMuPDF for more precise PDF elements (if available)
-    if PYMUPDF_AVAILABLE:
-        try:
-            doc = fitz.open(pdf_path)
-            if page_num < len(doc):
-                page = doc[page_num]
-                pymupdf_results = extract_pdf_elements(page)
-                
-                # Merge results (PyMuPDF often more accurate)
-                results["pdf_drawings"] = pymupdf_results["drawings"]
-                results["pdf_shapes"] = pymupdf_results["shapes"]
-            doc.close()
-        except Exception as e:
-            print(f"PyMuPDF error: {e}")
-    else:
-        results["pdf_drawings"] = []
-        results["pdf_shapes"] = []
+    results["checkboxes"] = detect_checkboxes(gray, cleaned, binary, dpi)
+    
+    # Method 2: Using PyMuPDF for more precise PDF elements on the same page
+    try:
+        pymupdf_results = extract_pdf_elements(page)
+        
+        # Merge results (PyMuPDF often more accurate)
+        results["pdf_shapes"] = pymupdf_results["shapes"]
+    except Exception as e:
+        print(f"PyMuPDF error: {e}")
     return results
 
-def detect_lines(gray_image, dpi):
+def detect_lines(gray_image, edges, dpi):
     """
-    Detect horizontal and vertical lines using HoughLinesP
+    Detect horizontal and vertical lines using FastLineDetector or HoughLinesP
+    (on the precomputed Canny edges)
     """
     lines_data = []
     
-    # More aggressive edge detection for cleaner lines
-    edges = cv2.Canny(gray_image, 100, 200, apertureSize=3)
-    
-    # Detect lines with stricter parameters
-    lines = cv2.HoughLinesP(edges, 1, np.pi/180, threshold=200, 
-                           minLineLength=100, maxLineGap=5)
+    if FLD_AVAILABLE:
+        # FLD runs its own Canny pass and merges collinear segments
+        fld = cv2.ximgproc.createFastLineDetector(length_threshold=scale_px(100, dpi),
+                                                  distance_threshold=1.41421356,
+                                                  canny_th1=100, canny_th2=200, canny_aperture_size=3,
+                                                  do_merge=True)
+        lines = fld.detect(gray_image)
+    else:
+        # Detect lines with stricter parameters
+        lines = cv2.HoughLinesP(edges, 1, np.pi/180, threshold=scale_px(200, dpi), 
+                               minLineLength=scale_px(100, dpi), maxLineGap=scale_px(5, dpi))
     
-    if lines is not None:
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            
-            # Convert pixels to points (assuming 150 DPI)
-            points_per_pixel = 72 / dpi
-            x1_pt = x1 * points_per_pixel
-            y1_pt = y1 * points_per_pixel
-            x2_pt = x2 * points_per_pixel
-            y2_pt = y2 * points_per_pixel
-            
-            # Determine orientation
-            length = np.sqrt((x2-x1)**2 + (y2-y1)**2)
-            angle = np.arctan2(y2-y1, x2-x1) * 180 / np.pi
-            
-            if abs(angle) < 10 or abs(angle-180) < 10:
-                orientation = "horizontal"
-            elif abs(angle-90) < 10 or abs(angle+90) < 10:
-                orientation = "vertical"
-            else:
-                orientation = "diagonal"
-            
-            # Detect if line is dotted (simple approach)
-            line_style = detect_line_style(gray_image, x1, y1, x2, y2)
-            
+    lines = to_numpy(lines)
+    if lines is not None and len(lines):
+        segments = lines.reshape(-1, 4).astype(np.float64)
+        
+        # Convert pixels to points for all segments at once
+        points_per_pixel = 72 / dpi
+        coords_pt = np.round(segments * points_per_pixel, 2)
+        
+        # Determine orientation
+        dxy = segments[:, 2:] - segments[:, :2]
+        lengths = np.hypot(dxy[:, 0], dxy[:, 1])
+        angles = np.degrees(np.arctan2(dxy[:, 1], dxy[:, 0]))
+        abs_angles = np.abs(angles)
+        orientations = np.select(
+            [(abs_angles < 10) | (np.abs(abs_angles - 180) < 10), np.abs(abs_angles - 90) < 10],
+            ["horizontal", "vertical"],
+            default="diagonal"
+        )
+        
+        # Detect if lines are dotted (simple approach)
+        line_styles = detect_line_styles(gray_image, segments)
+        
+        lengths_pt = np.round(lengths * points_per_pixel, 2)
+        angles = np.round(angles, 2)
+        
+        # Only building the output dicts remains per line
+        rows = zip(coords_pt.tolist(), orientations.tolist(), line_styles.tolist(),
+                   lengths_pt.tolist(), angles.tolist())
+        for (x1_pt, y1_pt, x2_pt, y2_pt), orientation, line_style, length, angle in rows:
             lines_data.append({
                 "element_type": "line",
                 "orientation": orientation,
                 "line_style": line_style,
                 "position": {
-                    "x1": round(x1_pt, 2),
-                    "y1": round(y1_pt, 2),
-                    "x2": round(x2_pt, 2),
-                    "y2": round(y2_pt, 2),
+                    "x1": x1_pt,
+                    "y1": y1_pt,
+                    "x2": x2_pt,
+                    "y2": y2_pt,
                     "units": "points"
                 },
-                "length": round(length * points_per_pixel, 2),
-                "angle": round(angle, 2)
+                "length": length,
+                "angle": angle
             })
     
     return lines_data
 
-def detect_line_style(gray_image, x1, y1, x2, y2):
+def detect_line_styles(gray_image, segments, num_samples=20):
     """
-    Simple dotted line detection by sampling points along the line
+    Simple dotted line detection by sampling points along each line
     """
-    num_samples = 20
-    black_count = 0
+    height, width = gray_image.shape[:2]
     
-    for i in range(num_samples):
-        t = i / (num_samples - 1)
-        x = int(x1 + t * (x2 - x1))
-        y = int(y1 + t * (y2 - y1))
-        
-        if 0 <= x < gray_image.shape[1] and 0 <= y < gray_image.shape[0]:
-            if gray_image[y, x] < 128:  # Dark pixel
-                black_count += 1
+    # Sample coordinates for every segment at once, shape (N, num_samples)
+    t = np.linspace(0, 1, num_samples)
+    x1, y1, x2, y2 = (segments[:, [i]] for i in range(4))
+    xs = (x1 + t * (x2 - x1)).astype(np.int32)
+    ys = (y1 + t * (y2 - y1)).astype(np.int32)
+    
+    # Gather with clamped indices in one pass; samples falling outside the
+    # image are masked out afterwards and count as not black
+    valid = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    samples = gray_image[np.clip(ys, 0, height - 1), np.clip(xs, 0, width - 1)]
+    dark = (samples < 128) & valid  # Dark pixel
     
     # If less than 70% of samples are black, likely dotted
-    if black_count / num_samples < 0.7:
-        return "dotted"
-    else:
-        return "solid"
+    return np.where(dark.sum(axis=1) / num_samples < 0.7, "dotted", "solid")
 
-def detect_background_colors(img, dpi):
+def sample_background_colors(img, dpi):
     """
-    Detect significant background colors by clustering
+    Sample non-white block colors and their pixel boxes (x1, y1, x2, y2)
     """
-    from sklearn.cluster import KMeans
-    import warnings
-    warnings.filterwarnings('ignore')
-    
-    colors_data = []
     height, width = img.shape[:2]
-    points_per_pixel = 72 / dpi
     
     # Sample fewer, larger regions
-    grid_size = 100  # Larger regions
+    grid_size = scale_px(100, dpi)  # Larger regions
     min_region_size = 50 * 50  # Minimum significant area
     
-    # Collect all non-white colors first
-    all_colors = []
-    positions = []
+    # Same blocks the old per-region loop visited
+    rows = (height - 1) // grid_size
+    cols = (width - 1) // grid_size
+    if rows < 1 or cols < 1:
+        return np.empty((0, 3), dtype=np.float32), np.empty((0, 4), dtype=int)
     
-    for y in range(0, height-grid_size, grid_size):
-        for x in range(0, width-grid_size, grid_size):
-            region = img[y:y+grid_size, x:x+grid_size]
-            if region.size > 0:
-                # Get dominant color in region
-                avg_color = np.mean(region.reshape(-1, 3), axis=0)
-                
-                # Skip near-white backgrounds (be more strict)
-                if np.mean(avg_color) < 230 and np.std(avg_color) > 10:  # Not white and has variation
-                    all_colors.append(avg_color)
-                    positions.append((x, y, grid_size, grid_size))
+    # INTER_AREA with an integer scale factor yields each block's mean color;
+    # float32 is plenty for 8-bit colors and keeps KMeans on its float32 path
+    block_means = cv2.resize(img[:rows * grid_size, :cols * grid_size], (cols, rows),
+                             interpolation=cv2.INTER_AREA).reshape(-1, 3).astype(np.float32)
+    block_ys, block_xs = np.indices((rows, cols)).reshape(2, -1) * grid_size
+    
+    # Skip near-white backgrounds (be more strict)
+    keep = (block_means.mean(axis=1) < 230) & (block_means.std(axis=1) > 10)  # Not white and has variation
+    all_colors = block_means[keep]
+    positions = np.column_stack((block_xs[keep], block_ys[keep],
+                                 block_xs[keep] + grid_size, block_ys[keep] + grid_size))
+    return all_colors, positions
+
+def cluster_background_colors(all_colors, positions, dpi):
+    """
+    Detect significant background colors by clustering sampled block colors
+    """
+    from sklearn.cluster import MiniBatchKMeans
+    import warnings
+    warnings.filterwarnings('ignore')
+    
+    colors_data = []
+    points_per_pixel = 72 / dpi
     
     if len(all_colors) < 2:
         return colors_data
     
     # Cluster colors to find distinct background colors
-    all_colors = np.array(all_colors)
     n_clusters = min(5, len(all_colors))  # Max 5 distinct colors
     
     try:
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3,
+                                 batch_size=256, max_iter=50)
         color_labels = kmeans.fit_predict(all_colors)
         
         # Group regions by color cluster
         for cluster_id in range(n_clusters):
-            cluster_positions = [positions[i] for i in range(len(positions)) if color_labels[i] == cluster_id]
+            cluster_positions = positions[color_labels == cluster_id]
             
             if len(cluster_positions) > 2:  # Only if color appears in multiple regions
                 cluster_color = kmeans.cluster_centers_[cluster_id]
                 
                 # Find bounding box of all regions with this color
-                min_x = min(pos[0] for pos in cluster_positions)
-                min_y = min(pos[1] for pos in cluster_positions)
-                max_x = max(pos[0] + pos[2] for pos in cluster_positions)
-                max_y = max(pos[1] + pos[3] for pos in cluster_positions)
+                min_x, min_y = cluster_positions[:, :2].min(axis=0).tolist()
+                max_x, max_y = cluster_positions[:, 2:].max(axis=0).tolist()
                 
                 colors_data.append({
                     "element_type": "background_color",
@@ -210,42 +301,71 @@ def detect_background_colors(img, dpi):
     
     return colors_data
 
-def detect_checkboxes(gray_image, dpi):
+def detect_checkboxes(gray_image, cleaned, binary, dpi):
     """
-    Detect checkbox squares using template matching and contour detection
+    Detect checkbox squares using template matching (around components of the
+    binarized image) and contour detection (on the morphologically closed image)
     """
     checkboxes = []
+    # Kept detections bucketed by position, for duplicate checks
+    grid = {}
     points_per_pixel = 72 / dpi
     
     # Method 1: Template matching for empty checkboxes
     # Create checkbox template (empty square)
-    template_size = 20
+    template_size = scale_px(20, dpi, minimum=10)
+    border = scale_px(2, dpi)
     template = np.ones((template_size, template_size), dtype=np.uint8) * 255
-    cv2.rectangle(template, (2, 2), (template_size-3, template_size-3), 0, 2)
+    cv2.rectangle(template, (border, border), (template_size-1-border, template_size-1-border), 0, border)
     
-    # Match template
-    result = cv2.matchTemplate(gray_image, template, cv2.TM_CCOEFF_NORMED)
     threshold = 0.6
-    locations = np.where(result >= threshold)
-    
-    for pt in zip(*locations[::-1]):
-        checkboxes.append({
-            "element_type": "checkbox",
-            "detection_method": "template_matching",
-            "position": {
-                "x": round(pt[0] * points_per_pixel, 2),
-                "y": round(pt[1] * points_per_pixel, 2),
-                "width": round(template_size * points_per_pixel, 2),
-                "height": round(template_size * points_per_pixel, 2),
-                "units": "points"
-            },
-            "confidence": float(result[pt[1], pt[0]])
-        })
+    nms_kernel = np.ones((template_size, template_size), np.uint8)
+    template_size_pt = round(template_size * points_per_pixel, 2)
+    
+    # Only match around checkbox-sized, square-ish components of the binarized page
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary)
+    comp_w = stats[1:, cv2.CC_STAT_WIDTH]
+    comp_h = stats[1:, cv2.CC_STAT_HEIGHT]
+    min_size, max_size = scale_px(10, dpi), scale_px(40, dpi)
+    candidates = ((comp_w >= min_size) & (comp_w <= max_size) &
+                  (comp_h >= min_size) & (comp_h <= max_size) &
+                  (comp_w >= 0.8 * comp_h) & (comp_w <= 1.2 * comp_h))
+    margin = template_size // 4
+    
+    for x, y, w, h in stats[1:, :4][candidates].tolist():
+        roi_x, roi_y = max(0, x - margin), max(0, y - margin)
+        roi = gray_image[roi_y:y + h + margin, roi_x:x + w + margin]
+        if roi.shape[0] < template_size or roi.shape[1] < template_size:
+            continue
+        
+        # Match template
+        result = cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED)
+        
+        # Keep only local maxima so each checkbox yields one peak, not a cluster
+        local_max = cv2.dilate(result, nms_kernel)
+        ys, xs = np.nonzero((result == local_max) & (result >= threshold))
+        confidences = result[ys, xs]
+        
+        for match_x, match_y, confidence in zip(np.round((xs + roi_x) * points_per_pixel, 2).tolist(),
+                                                np.round((ys + roi_y) * points_per_pixel, 2).tolist(),
+                                                confidences.tolist()):
+            add_unique_checkbox(grid, checkboxes, {
+                "element_type": "checkbox",
+                "detection_method": "template_matching",
+                "position": {
+                    "x": match_x,
+                    "y": match_y,
+                    "width": template_size_pt,
+                    "height": template_size_pt,
+                    "units": "points"
+                },
+                "confidence": confidence
+            })
     
     # Method 2: Contour detection with stricter filtering
-    # Apply morphological operations to clean up the image
-    kernel = np.ones((3,3), np.uint8)
-    cleaned = cv2.morphologyEx(gray_image, cv2.MORPH_CLOSE, kernel)
+    min_side, max_side = scale_px(15, dpi), scale_px(35, dpi)
+    area_scale = (dpi / REFERENCE_DPI) ** 2
+    inset = scale_px(3, dpi)
     
     # Find contours
     contours, _ = cv2.findContours(cleaned, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -265,18 +385,18 @@ def detect_checkboxes(gray_image, dpi):
             extent = area / (w * h) if (w * h) != 0 else 0
             
             # Filter for checkbox-sized squares with good properties
-            if (15 <= w <= 35 and 15 <= h <= 35 and  # Size range
-                0.8 <= aspect_ratio <= 1.2 and       # Square-ish
-                0.7 <= extent <= 1.0 and             # Fill ratio
-                200 <= area <= 1000):                # Area range
+            if (min_side <= w <= max_side and min_side <= h <= max_side and  # Size range
+                0.8 <= aspect_ratio <= 1.2 and                               # Square-ish
+                0.7 <= extent <= 1.0 and                                     # Fill ratio
+                200 * area_scale <= area <= 1000 * area_scale):              # Area range
                 
                 # Check if it's likely a checkbox (not just any rectangle)
                 # Look for mostly empty interior
-                roi = gray_image[y+3:y+h-3, x+3:x+w-3]
+                roi = gray_image[y+inset:y+h-inset, x+inset:x+w-inset]
                 if roi.size > 0:
                     interior_mean = np.mean(roi)
                     if interior_mean > 200:  # Mostly white interior
-                        checkboxes.append({
+                        add_unique_checkbox(grid, checkboxes, {
                             "element_type": "checkbox",
                             "detection_method": "contour_analysis",
                             "position": {
@@ -294,19 +414,27 @@ def detect_checkboxes(gray_image, dpi):
                             }
                         })
     
-    # Remove duplicate detections (same position)
-    unique_checkboxes = []
-    for cb in checkboxes:
-        is_duplicate = False
-        for existing in unique_checkboxes:
-            if (abs(cb["position"]["x"] - existing["position"]["x"]) < 10 and
-                abs(cb["position"]["y"] - existing["position"]["y"]) < 10):
-                is_duplicate = True
-                break
-        if not is_duplicate:
-            unique_checkboxes.append(cb)
-    
-    return unique_checkboxes
+    return checkboxes
+
+def add_unique_checkbox(grid, checkboxes, checkbox, tolerance=10):
+    """
+    Append checkbox unless one within tolerance points was already kept
+    """
+    x = checkbox["position"]["x"]
+    y = checkbox["position"]["y"]
+    cell_x = int(x // tolerance)
+    cell_y = int(y // tolerance)
+    
+    # Anything within tolerance lies in the surrounding 3x3 cells
+    for neighbor_x in (cell_x - 1, cell_x, cell_x + 1):
+        for neighbor_y in (cell_y - 1, cell_y, cell_y + 1):
+            for existing in grid.get((neighbor_x, neighbor_y), ()):
+                if (abs(x - existing["position"]["x"]) < tolerance and
+                    abs(y - existing["position"]["y"]) < tolerance):
+                    return
+    
+    grid.setdefault((cell_x, cell_y), []).append(checkbox)
+    checkboxes.append(checkbox)
 
 def extract_pdf_elements(page):
     """
@@ -343,20 +471,31 @@ def extract_pdf_elements(page):
                 })
     
     return {
-        "drawings": drawings,
         "shapes": shapes
     }
 
+def save_results(results, output_path):
+    """
+    Stream results to JSON one top-level key at a time
+    """
+    with io.BufferedWriter(io.FileIO(output_path, "w"), buffer_size=1 << 20) as f:
+        f.write(b"{")
+        for i, (key, value) in enumerate(results.items()):
+            if i:
+                f.write(b",")
+            f.write(f'"{key}":'.encode())
+            f.write(orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY))
+        f.write(b"}")
+
 # Usage example
 if __name__ == "__main__":
     pdf_path = "f1040.pdf"  # Replace with your PDF path
     
     try:
-        results = detect_lines_and_colors(pdf_path, page_num=0, dpi=150)
+        results = detect_lines_and_colors(pdf_path, page_num=0, dpi=DETECTION_DPI)
         
         # Save results to JSON
-        with open("detected_elements.json", "w") as f:
-            json.dump(results, f, indent=2)
+        save_results(results, "detected_elements.json")
         
         print(f"Detected {len(results['lines'])} lines")
         print(f"Detected {len(results['background_colors'])} colored regions")
@@ -365,8 +504,8 @@ if __name__ == "__main__":
         # Print first few results
         if results['lines']:
             print("\nFirst line detected:")
-            print(json.dumps(results['lines'][0], indent=2))
+            print(orjson.dumps(results['lines'][0], option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).decode())
             
     except Exception as e:
         print(f"Error processing PDF: {e}")
-        print("Make sure you have installed: pip install opencv-python pdf2image PyMuPDF pillow")
\ No newline at end of file
+        print("Make sure you have installed: pip install opencv-contrib-python PyMuPDF orjson")
\ No newline at end of file